@@ -370,10 +370,12 @@ def find_transaction_date(data, description: str):
     latest = matches.sort_values(by='date', ascending=False).iloc[0]
     return f"The last transaction for '{description}' was on *{latest['date'].strftime('%Y-%m-%d')}* for {CURRENCY_SYMBOL}{abs(latest['amount']):,.2f}."
 
-def visualize_spending(data, time_period: str = None):
-    import matplotlib
-    matplotlib.use('Agg')  # Use non-GUI backend for Flask/threaded environments
-    import matplotlib.pyplot as plt
+def visualize_spending(data, time_period: str = None, file_name: str = "spending_chart.png", out_dir: str = None):
+    # Own Figure rather than pyplot's global current figure: charts may be
+    # drawn from several worker threads at once
+    from matplotlib.figure import Figure
+    from matplotlib.patches import Circle
+    from matplotlib.style import library as style_library
     df = get_df(data)
     period_text = "All Time"
     if time_period:
@@ -385,19 +387,18 @@ def visualize_spending(data, time_period: str = None):
     if expenses.empty: return "No spending data found for this period to visualize."
     expenses['amount'] = abs(expenses['amount'])
     category_totals = expenses.groupby('category')['amount'].sum()
-    plt.style.use('seaborn-v0_8-deep')
-    plt.figure(figsize=(10, 8))
-    plt.pie(category_totals, labels=category_totals.index, autopct='%1.1f%%', startangle=140, pctdistance=0.85)
-    plt.title(f'Spending Breakdown for {period_text}', fontsize=16)
-    centre_circle = plt.Circle((0,0),0.70,fc='white')
-    fig = plt.gcf()
-    fig.gca().add_artist(centre_circle)
-    plt.axis('equal')
-    plt.tight_layout()
-    file_name = "spending_chart.png"
-    plt.savefig(file_name)
-    plt.close()
-    return f"I've generated a pie chart of your spending and saved it as *{file_name}*."
+    # Colours of the seaborn-v0_8-deep sheet, without changing global rcParams
+    colors = style_library['seaborn-v0_8-deep']['axes.prop_cycle'].by_key()['color']
+    fig = Figure(figsize=(10, 8))
+    ax = fig.subplots()
+    ax.pie(category_totals, labels=category_totals.index, autopct='%1.1f%%', startangle=140, pctdistance=0.85, colors=colors)
+    ax.set_title(f'Spending Breakdown for {period_text}', fontsize=16)
+    centre_circle = Circle((0,0),0.70,fc='white')
+    ax.add_artist(centre_circle)
+    ax.axis('equal')
+    fig.tight_layout()
+    fig.savefig(os.path.join(out_dir, file_name) if out_dir else file_name)
+    return {"text": f"I've generated a pie chart of your spending and saved it as *{file_name}*.", "image": file_name}
 
 def get_financial_advice(data):
     df = get_df(data)
@@ -758,6 +759,9 @@ def main():
                 response = f"An error occurred while running the tool: {e}"
         else:
             response = "I'm not sure how to do that. Please try rephrasing."
+
+        if isinstance(response, dict):
+            response = response["text"]
             
         print(f"🤖 Assistant: {response}")
 
@@ -2,9 +2,26 @@ import re
 import os
 import uuid
 import json
-from flask import Flask, request, render_template_string, session, redirect, url_for, send_file
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from functools import lru_cache
+from flask import Flask, request, session, redirect, url_for, send_from_directory, jsonify
 from markupsafe import Markup, escape
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import cmarkgfm
+except ImportError:
+    cmarkgfm = None
+
 # Import finbot utilities and tools
 from finbot import load_data, get_tool_call
 from finbot import (
@@ -28,90 +45,302 @@ os.makedirs(MEDIA_DIR, exist_ok=True)
 # Cache data per process
 CACHE = {
     "data": None,
-    "sessions": {}
+    "sessions": {},
+    "locks": {},
+    # Bumped whenever a tool that may change CACHE["data"] runs
+    "data_version": 0,
+    # job_id -> (submit time, Future), oldest first; see _prune_jobs
+    "jobs": {}
 }
 
+# Planner (LLM) calls and tools run here so request threads return at once
+EXECUTOR = ThreadPoolExecutor(max_workers=8)
+_JOBS_LOCK = threading.Lock()
+# Finished jobs are dropped this many seconds after submit, polled or not
+_JOB_TTL = 600
+
+# "entry" is (key, (sorted sessions, pinned ids)), keyed on (generation,
+# chat dir mtime, pinned file mtime); every chat write bumps "generation".
+# Per process: appending to a chat leaves the directory mtime alone, so
+# other workers keep their old order until a chat is created, deleted or
+# pinned. Titles stat their own file, so they stay current everywhere.
+_SESSIONS_CACHE = {"generation": 0, "entry": None}
+# chat_id -> (file mtime, first user message) for sidebar titles
+_TITLE_CACHE = {}
+# chat_id -> ((file mtime, size), parsed history), least recently used first
+_HISTORY_CACHE = OrderedDict()
+_HISTORY_CACHE_SIZE = 128
+# (normalized query, data version, date) -> (response_html, image_path)
+_RESPONSE_CACHE = OrderedDict()
+_RESPONSE_CACHE_SIZE = 512
+# Tools whose reply depends only on the query and the current data
+_CACHEABLE_TOOLS = {"greeting_response", "get_summary", "get_top_spending_category"}
+_LRU_LOCK = threading.Lock()
+# Parsed pinned_chats.json, reloaded only when its mtime changes
+_PINNED = {"mtime": -1, "value": []}
+
+# Patterns used on every request/response, compiled once at import
+_SAFE = re.compile(r'[^a-zA-Z0-9_.-]')
+# Headings and HR share one alternation; bold, italic and list items
+# then run in the original order, as plain template substitutions
+_MD_BLOCK = re.compile(
+    r'(?P<h3>^\s*### (?P<h3_text>.*)$)'
+    r'|(?P<h2>^\s*## (?P<h2_text>.*)$)'
+    r'|(?P<hr>(?:^|\n)-{3,}(?:\n|$))',
+    re.MULTILINE
+)
+_BOLD = re.compile(r'\*\*(.+?)\*\*')
+_ITALIC = re.compile(r'\*(.+?)\*')
+_LI = re.compile(r'^\s*-\s+(.*\S.*)$', re.MULTILINE)
+_NL2 = re.compile(r'\n{2,}')
+# Tool replies put "---" straight under a text line and mean a rule;
+# CommonMark would read that as a setext heading without a blank line first
+_HR_LINE = re.compile(r'^(-{3,})[ \t]*$', re.MULTILINE)
+
 def safe_filename(name: str) -> str:
-    return re.sub(r'[^a-zA-Z0-9_.-]', '_', name or "")
+    return _SAFE.sub('_', name or "")
+
+def _json_dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+def _json_loads(raw: bytes):
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+def _first_line(f):
+    """Return the first non-blank line of a binary file; b"" if there is none."""
+    for line in f:
+        if line.strip():
+            return line
+    return b""
+
+def _is_legacy_array(first):
+    return first.lstrip().startswith(b"[")
+
+def _iter_chat_file(f):
+    """Yield messages from a chat file opened in binary mode.
+
+    Chats are stored one JSON message per line. Files written before that
+    hold a single JSON array and are decoded whole.
+    """
+    first = _first_line(f)
+    if _is_legacy_array(first):
+        yield from _json_loads(first + f.read())
+        return
+    for line in itertools.chain((first,), f):
+        if line.strip():
+            yield _json_loads(line)
+
+def _history_stamp(path):
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+def _lru_get(cache, key):
+    with _LRU_LOCK:
+        hit = cache.get(key)
+        if hit is not None:
+            cache.move_to_end(key)
+        return hit
+
+def _lru_put(cache, key, value, max_size):
+    with _LRU_LOCK:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > max_size:
+            cache.popitem(last=False)
+
+def _remember_history(chat_id, stamp, history):
+    _lru_put(_HISTORY_CACHE, chat_id, (stamp, history), _HISTORY_CACHE_SIZE)
 
 def save_chat_history(chat_id, history):
     path = os.path.join(CHAT_DIR, f"{safe_filename(chat_id)}.json")
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(history, f, ensure_ascii=False)
+    with open(path, "wb") as f:
+        f.write(b"".join(_json_dumps(msg) + b"\n" for msg in history))
+    _remember_history(chat_id, _history_stamp(path), list(history))
+    _invalidate_sessions()
+
+def _chat_lock(chat_id):
+    return CACHE["locks"].setdefault(chat_id, threading.Lock())
+
+def _is_legacy_chat_file(path):
+    try:
+        with open(path, "rb") as f:
+            return _is_legacy_array(_first_line(f))
+    except OSError:
+        return False
+
+def append_chat_messages(chat_id, new_msgs):
+    """Append messages to a chat without rewriting what is already on disk."""
+    path = os.path.join(CHAT_DIR, f"{safe_filename(chat_id)}.json")
+    with _chat_lock(chat_id):
+        if _is_legacy_chat_file(path):
+            # Old single-array file: migrate with one full rewrite
+            save_chat_history(chat_id, load_chat_history(chat_id) + list(new_msgs))
+            return
+        hit = _HISTORY_CACHE.get(chat_id)
+        fresh = hit is not None and os.path.exists(path) and hit[0] == _history_stamp(path)
+        with open(path, "ab") as f:
+            f.write(b"".join(_json_dumps(msg) + b"\n" for msg in new_msgs))
+            f.flush()
+            os.fsync(f.fileno())
+        # Carry a cached copy forward so the next read skips the disk
+        if fresh:
+            _remember_history(chat_id, _history_stamp(path), hit[1] + list(new_msgs))
+        else:
+            _HISTORY_CACHE.pop(chat_id, None)
+    _invalidate_sessions()
 
 def load_pinned_chats():
-    if not os.path.exists(PINNED_CHATS_FILE):
+    """Return the pinned chat ids. The list is shared with _PINNED and must not be mutated."""
+    try:
+        mtime = os.stat(PINNED_CHATS_FILE).st_mtime_ns
+    except OSError:
         return []
+    if mtime == _PINNED["mtime"]:
+        return _PINNED["value"]
     try:
-        with open(PINNED_CHATS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
+        with open(PINNED_CHATS_FILE, "rb") as f:
+            pinned_ids = _json_loads(f.read())
     except (json.JSONDecodeError, FileNotFoundError):
         return []
+    _PINNED["mtime"] = mtime
+    _PINNED["value"] = pinned_ids
+    return pinned_ids
 
 def save_pinned_chats(pinned_ids):
-    with open(PINNED_CHATS_FILE, "w", encoding="utf-8") as f:
-        json.dump(pinned_ids, f, ensure_ascii=False)
+    with open(PINNED_CHATS_FILE, "wb") as f:
+        f.write(_json_dumps(pinned_ids))
+    _PINNED["mtime"] = os.stat(PINNED_CHATS_FILE).st_mtime_ns
+    _PINNED["value"] = list(pinned_ids)
+    _invalidate_sessions()
 
 def load_chat_history(chat_id):
+    """Return the parsed chat, served from _HISTORY_CACHE while the file is unchanged.
+
+    The returned list is shared with the cache and must not be mutated.
+    """
     try:
         path = os.path.join(CHAT_DIR, f"{safe_filename(chat_id)}.json")
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        stamp = _history_stamp(path)
+        hit = _lru_get(_HISTORY_CACHE, chat_id)
+        if hit and hit[0] == stamp:
+            return hit[1]
+        with open(path, "rb") as f:
+            history = list(_iter_chat_file(f))
     except Exception:
         return []
+    _remember_history(chat_id, stamp, history)
+    return history
 
-def list_chat_sessions():
-    pinned_ids = set(load_pinned_chats())
-    sessions = []
-    for fname in os.listdir(CHAT_DIR):
-        if fname.endswith(".json") and fname != "pinned_chats.json":
-            sessions.append(fname[:-5])
+def _invalidate_sessions():
+    with _LRU_LOCK:
+        _SESSIONS_CACHE["generation"] += 1
 
-    pinned_sessions = [cid for cid in load_pinned_chats() if cid in sessions]
-    unpinned_sessions = [cid for cid in sessions if cid not in pinned_ids]
+def _sessions_cache_key():
+    # Generation is read before the scan, so a write during it leaves a stale key
+    generation = _SESSIONS_CACHE["generation"]
+    pinned_mtime = os.stat(PINNED_CHATS_FILE).st_mtime_ns if os.path.exists(PINNED_CHATS_FILE) else 0
+    return (generation, os.stat(CHAT_DIR).st_mtime_ns, pinned_mtime)
 
-    unpinned_sessions.sort(key=lambda cid: os.path.getmtime(os.path.join(CHAT_DIR, f"{cid}.json")), reverse=True)
+def _scan_chat_sessions():
+    """Return (sorted chat ids, pinned id set) from one directory scan."""
+    key = _sessions_cache_key()
+    entry = _SESSIONS_CACHE["entry"]
+    if entry is not None and entry[0] == key:
+        return entry[1]
+
+    pinned_list = load_pinned_chats()
+    pinned_ids = set(pinned_list)
+    with os.scandir(CHAT_DIR) as it:
+        mtimes = {
+            entry.name[:-5]: entry.stat().st_mtime_ns
+            for entry in it
+            if entry.is_file() and entry.name.endswith(".json") and entry.name != "pinned_chats.json"
+        }
+
+    pinned_sessions = [cid for cid in pinned_list if cid in mtimes]
+    unpinned_sessions = [cid for cid in mtimes if cid not in pinned_ids]
+
+    unpinned_sessions.sort(key=mtimes.__getitem__, reverse=True)
     
-    return pinned_sessions + unpinned_sessions
+    value = (pinned_sessions + unpinned_sessions, pinned_ids)
+    # Key and value are stored as one tuple so readers never see them mixed
+    _SESSIONS_CACHE["entry"] = (key, value)
+    return value
 
-def markdown_to_html(text: str) -> str:
-    if not text:
-        return ""
-    text = escape(text)
-    text = text.replace("\r\n", "\n").replace("\r", "\n")
+def list_chat_sessions():
+    return _scan_chat_sessions()[0]
+
+def _md_block(m):
+    kind = m.lastgroup
+    if kind == "hr":
+        return "\n<hr>\n"
+    return f"<{kind}>{m.group(f'{kind}_text')}</{kind}>"
+
+def _wrap_lists(text):
+    """Wrap each run of <li> lines in <ul>...</ul> with one linear scan.
 
-    # Headings
-    text = re.sub(r'^\s*### (.*)$', r'<h3>\1</h3>', text, flags=re.MULTILINE)
-    text = re.sub(r'^\s*## (.*)$', r'<h2>\1</h2>', text, flags=re.MULTILINE)
+    The newlines around a run stay inside the <ul>, so blank lines next to
+    a list do not turn into <br>.
+    """
+    out = []
+    in_ul = False
+    for line in text.split("\n"):
+        is_li = line.startswith("<li>")
+        if is_li and not in_ul:
+            if out:
+                out[-1] += "<ul>"
+            else:
+                line = "<ul>" + line
+        elif in_ul and not is_li:
+            line = "</ul>" + line
+        out.append(line)
+        in_ul = is_li
+    if in_ul:
+        out[-1] += "</ul>"
+    return "\n".join(out)
 
-    # HR
-    text = re.sub(r'(?:^|\n)-{3,}(?:\n|$)', r'\n<hr>\n', text, flags=re.MULTILINE)
+@lru_cache(maxsize=1024)
+def _md_cached(text: str) -> str:
+    # Pure function of the text; stock replies repeat often
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
 
-    # Bold and Italic
-    text = re.sub(r'\*\*(.+?)\*\*', r'<b>\1</b>', text)
-    text = re.sub(r'\*(.+?)\*', r'<i>\1</i>', text)
+    if cmarkgfm is not None:
+        # Raw text on purpose: cmark escapes it itself, and pre-escaped
+        # entities would show literally inside code spans and blocks. The
+        # default (no CMARK_OPT_UNSAFE) omits raw HTML and unsafe URLs.
+        #
+        # This is CommonMark, not the regex rules below, so output differs:
+        # <strong>/<em> and <p> paragraphs, "1." lines become <ol>, "*"
+        # needs flanking text to start italics ("5 * 2" stays plain), a
+        # line right after a list item continues that item, code spans
+        # and indented code blocks render, and raw HTML is dropped rather
+        # than shown as text.
+        return cmarkgfm.markdown_to_html(_HR_LINE.sub(r'\n\1', text))
 
-    # List items
-    text = re.sub(r'^\s*-\s+(.*\S.*)$', r'<li>\1</li>', text, flags=re.MULTILINE)
+    text = str(escape(text))
+
+    # Headings and HR in one pass
+    text = _MD_BLOCK.sub(_md_block, text)
+    if "*" in text:
+        text = _ITALIC.sub(r'<i>\1</i>', _BOLD.sub(r'<b>\1</b>', text))
+    text = _LI.sub(r'<li>\1</li>', text)
 
     # Wrap consecutive <li> into <ul>
-    def ul_wrap(m):
-        # Correctly wrap list items without removing newlines between them.
-        return f'<ul>{m.group(0)}</ul>'
-    text = re.sub(r'(?:^|\n)(?:<li>.*?</li>\n?)+', ul_wrap, text, flags=re.DOTALL)
+    text = _wrap_lists(text)
 
     # Double newlines => <br>
-    text = re.sub(r'\n{2,}', r'<br>', text)
-    return Markup(text)
+    text = _NL2.sub(r'<br>', text)
+    return text
 
-def extract_image_filename(text: str):
+def markdown_to_html(text: str) -> str:
     if not text:
-        return None
-    raw = re.sub(r'<[^>]+>', ' ', str(text))
-    match = re.search(r'\*?([A-Za-z0-9_\-]+\.png)\*?', raw)
-    if match:
-        return safe_filename(match.group(1))
-    return None
+        return ""
+    return Markup(_md_cached(str(text)))
 
 def get_tool_belt():
     return {
@@ -134,15 +363,27 @@ def get_tool_belt():
     }
 
 def chatbot_response(user_query, current_data):
+    """Return (response_html, image_path) for a user query.
+
+    Replies from _CACHEABLE_TOOLS are reused for the same normalized query
+    until a tool that may change the data runs. The date is part of the key
+    because "this month" / "last month" are resolved against today.
+    """
+    cache_key = (" ".join(user_query.lower().split()), CACHE["data_version"], date.today())
+    hit = _lru_get(_RESPONSE_CACHE, cache_key)
+    if hit is not None:
+        return hit
+
     try:
         plan = get_tool_call(user_query, current_data) or {}
     except Exception as e:
-        return markdown_to_html(f"**Error planning tool call:** {e}")
+        return markdown_to_html(f"**Error planning tool call:** {e}"), None
     tool_name = plan.get("tool_name")
     arguments = plan.get("arguments") or {}
     if not isinstance(arguments, dict):
         arguments = {}
 
+    cacheable = tool_name in _CACHEABLE_TOOLS
     if tool_name == "greeting_response":
         response = arguments.get("response", "Hi! How can I help?")
     else:
@@ -152,20 +393,36 @@ def chatbot_response(user_query, current_data):
             try:
                 if "data" not in arguments:
                     arguments["data"] = current_data
+                if tool_name == "visualize_spending":
+                    # Render straight into MEDIA_DIR under a unique name
+                    arguments.update(out_dir=MEDIA_DIR, file_name=f"chart_{uuid.uuid4().hex[:8]}.png")
                 response = fn(**arguments)
             except Exception as e:
+                cacheable = False
                 response = f"An error occurred while running the tool: {e}"
         else:
             response = "I'm not sure how to do that. Please try rephrasing."
-    return markdown_to_html(str(response))
+
+    image_path = None
+    # Tools that produce a file return {"text": ..., "image": filename}
+    if isinstance(response, dict):
+        response, image = response["text"], response.get("image")
+        if image:
+            image_path = f"media/{image}"
+    result = (markdown_to_html(str(response)), image_path)
+
+    if cacheable:
+        _lru_put(_RESPONSE_CACHE, cache_key, result, _RESPONSE_CACHE_SIZE)
+    else:
+        CACHE["data_version"] += 1
+    return result
 
 @app.route("/media/<path:filename>")
 def serve_media(filename):
-    filename = safe_filename(filename)
-    path = os.path.join(MEDIA_DIR, filename)
-    if os.path.exists(path):
-        return send_file(path, mimetype="image/png")
-    return "File not found", 404
+    # Chart names are unique per render and never rewritten, so let browsers keep them
+    resp = send_from_directory(MEDIA_DIR, safe_filename(filename), mimetype="image/png", conditional=True)
+    resp.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return resp
 
 HTML_TEMPLATE = """
 <!DOCTYPE html>
@@ -396,6 +653,8 @@ HTML_TEMPLATE = """
             border-radius: 12px 12px 12px 4px;
         }
         .bubble-head { font-weight: 700; margin-bottom: 4px; }
+        .bubble-content p { margin: 0 0 8px 0; }
+        .bubble-content p:last-child { margin-bottom: 0; }
         .bot-bubble img {
             max-width: 100%;
             border-radius: var(--radius-md);
@@ -484,7 +743,7 @@ HTML_TEMPLATE = """
                                 {% if is_pinned %}
                                     <span class="pin-indicator">&#128204;</span>
                                 {% endif %}
-                                {{ get_chat_title(cid, is_pinned) }}
+                                <span class="chat-title-text">{{ titles[cid] }}</span>
                             </span>
 
                             <span class="chat-actions" onclick="event.stopPropagation();">
@@ -519,15 +778,7 @@ HTML_TEMPLATE = """
                                     <div class="bubble-content">{{ msg.text }}</div>
                                 </div>
                             {% else %}
-                                <div class="bubble bot-bubble">
-                                    <div class="bubble-head">FinanceBot</div>
-                                    <div class="bubble-content">
-                                        {{ msg.text|safe }}
-                                        {% if msg.image %}
-                                            <img src="/{{ msg.image }}" alt="Generated Chart">
-                                        {% endif %}
-                                    </div>
-                                </div>
+                                {% include bot_bubble %}
                             {% endif %}
                         {% endfor %}
                     {% else %}
@@ -580,6 +831,36 @@ HTML_TEMPLATE = """
         }
         window.onload = scrollChatToBottom;
 
+        function readJson(response) {
+            if (!response.ok) throw new Error(response.statusText);
+            return response.json();
+        }
+
+        function pollJob(jobId) {
+            return fetch("/api/job/" + encodeURIComponent(jobId))
+                .then(readJson)
+                .then(data => {
+                    if (data.status !== "pending") return data;
+                    return new Promise(resolve => setTimeout(resolve, 500)).then(() => pollJob(jobId));
+                });
+        }
+
+        function updateActiveSession(title) {
+            var sidebar = document.getElementById('sidebar-history');
+            var active = sidebar && sidebar.querySelector('.sidebar-session.active');
+            if (!active) return;
+            var titleText = active.querySelector('.chat-title-text');
+            if (titleText && title) {
+                titleText.textContent = title;
+            }
+            // Most recently updated unpinned chat goes right below the pinned ones
+            if (!active.classList.contains('pinned')) {
+                var pinned = sidebar.querySelectorAll('.sidebar-session.pinned');
+                var anchor = pinned.length ? pinned[pinned.length - 1].nextElementSibling : sidebar.firstElementChild;
+                sidebar.insertBefore(active, anchor);
+            }
+        }
+
         document.getElementById('chat-form').onsubmit = function(e) {
             e.preventDefault();
             var input = document.getElementById('user_query');
@@ -596,13 +877,6 @@ HTML_TEMPLATE = """
                 welcome.remove();
             }
 
-            // Append user bubble
-            var userBubble = document.createElement('div');
-            userBubble.className = 'bubble user-bubble';
-            userBubble.innerHTML = '<div class="bubble-head">You</div>'
-                + '<div class="bubble-content">' + text.replace(/</g, "&lt;").replace(/>/g, "&gt;") + '</div>';
-            chatContainer.appendChild(userBubble);
-
             // Loading bubble
             var loadingBubble = document.createElement('div');
             loadingBubble.className = 'bubble bot-bubble loading-bubble';
@@ -610,26 +884,31 @@ HTML_TEMPLATE = """
             chatContainer.appendChild(loadingBubble);
             scrollChatToBottom();
 
-            // Perform POST
-            fetch(`/?chat_id=${new URLSearchParams(window.location.search).get("chat_id") || ""}`, {
+            // Submit the message, then poll its job for the new bot bubble
+            fetch("/api/message", {
                 method: "POST",
                 headers: { "Content-Type": "application/x-www-form-urlencoded" },
                 body: "user_query=" + encodeURIComponent(text)
             })
-            .then(response => response.text())
-            .then(html => {
-                var parser = new DOMParser();
-                var doc = parser.parseFromString(html, "text/html");
-                var newChatContainer = doc.querySelector('#chat-history .chat-container');
-                var newSidebar = doc.getElementById('sidebar-history');
-
-                if (newChatContainer) {
-                    chatContainer.innerHTML = newChatContainer.innerHTML;
-                }
-                var sidebar = document.getElementById('sidebar-history');
-                if (sidebar && newSidebar) {
-                    sidebar.innerHTML = newSidebar.innerHTML;
+            .then(readJson)
+            .then(data => {
+                // The server sends the user text already escaped
+                var userBubble = document.createElement('div');
+                userBubble.className = 'bubble user-bubble';
+                userBubble.innerHTML = '<div class="bubble-head">You</div>'
+                    + '<div class="bubble-content">' + data.user_html + '</div>';
+                chatContainer.insertBefore(userBubble, loadingBubble);
+                scrollChatToBottom();
+                return pollJob(data.job_id);
+            })
+            .then(data => {
+                if (data.status === "error") {
+                    loadingBubble.textContent = data.error;
+                    return;
                 }
+                loadingBubble.remove();
+                chatContainer.insertAdjacentHTML("beforeend", data.bot_html);
+                updateActiveSession(data.title_updated);
                 scrollChatToBottom();
             })
             .catch(() => {
@@ -641,6 +920,23 @@ HTML_TEMPLATE = """
 </html>
 """
 
+BOT_BUBBLE_TEMPLATE = """
+<div class="bubble bot-bubble">
+    <div class="bubble-head">FinanceBot</div>
+    <div class="bubble-content">
+        {{ msg.text|safe }}
+        {% if msg.image %}
+            <img src="/{{ msg.image }}" alt="Generated Chart">
+        {% endif %}
+    </div>
+</div>
+"""
+
+# Parsed once; render_template_string would re-parse the template per request
+_TEMPLATE = app.jinja_env.from_string(HTML_TEMPLATE)
+# Shared by the page render and /api/message
+_BOT_BUBBLE = app.jinja_env.from_string(BOT_BUBBLE_TEMPLATE)
+
 def get_or_create_chat(chat_id=None, new=False):
     """Unified chat session management"""
     if new or not chat_id:
@@ -655,25 +951,55 @@ def get_or_create_chat(chat_id=None, new=False):
     except Exception:
         return get_or_create_chat(new=True)
 
+def _first_user_text(path):
+    """Read the chat line by line, stopping at the first user message."""
+    try:
+        with open(path, "rb") as f:
+            for msg in _iter_chat_file(f):
+                if isinstance(msg, dict) and msg.get("role") == "user" and msg.get("text"):
+                    return msg["text"]
+    except (OSError, ValueError):
+        pass
+    return None
+
 def get_chat_title(chat_id, is_pinned=False):
-    history = load_chat_history(chat_id)
-    for msg in history:
-        if msg.get("role") == "user" and msg.get("text"):
-            text = msg["text"]
-            limit = 10 if is_pinned else 20
-            return text[:limit] + ("..." if len(text) > limit else "")
+    path = os.path.join(CHAT_DIR, f"{safe_filename(chat_id)}.json")
+    # Stat per call so appends from other workers still refresh the title
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return "New Chat"
+    hit = _TITLE_CACHE.get(chat_id)
+    if hit and hit[0] == mtime:
+        text = hit[1]
+    else:
+        text = _first_user_text(path)
+        _TITLE_CACHE[chat_id] = (mtime, text)
+    if text:
+        limit = 10 if is_pinned else 20
+        return text[:limit] + ("..." if len(text) > limit else "")
     return "New Chat"
 
+def snapshot_sidebar():
+    """Return (chat_sessions, pinned_ids, titles) for the sidebar."""
+    sessions, pinned_ids = _scan_chat_sessions()
+    titles = {cid: get_chat_title(cid, cid in pinned_ids) for cid in sessions}
+    return sessions, pinned_ids, titles
+
 @app.route("/delete_chat/<chat_id>", methods=["POST"])
 def delete_chat(chat_id):
     path = os.path.join(CHAT_DIR, f"{safe_filename(chat_id)}.json")
-    if os.path.exists(path):
-        os.remove(path)
+    with _chat_lock(chat_id):
+        if os.path.exists(path):
+            os.remove(path)
+    CACHE["locks"].pop(chat_id, None)
+    _invalidate_sessions()
+    _TITLE_CACHE.pop(chat_id, None)
+    _HISTORY_CACHE.pop(chat_id, None)
     
     pinned_ids = load_pinned_chats()
     if chat_id in pinned_ids:
-        pinned_ids.remove(chat_id)
-        save_pinned_chats(pinned_ids)
+        save_pinned_chats([cid for cid in pinned_ids if cid != chat_id])
 
     if session.get("chat_id") == chat_id:
         session.pop("chat_id", None)
@@ -685,59 +1011,89 @@ def delete_chat(chat_id):
 def pin_chat(chat_id):
     pinned_ids = load_pinned_chats()
     if chat_id in pinned_ids:
-        pinned_ids.remove(chat_id)
+        pinned_ids = [cid for cid in pinned_ids if cid != chat_id]
     else:
-        pinned_ids.insert(0, chat_id)
+        pinned_ids = [chat_id] + pinned_ids
     save_pinned_chats(pinned_ids)
     return redirect(url_for("home", chat_id=chat_id))
 
-@app.route("/", methods=["GET", "POST"])
-def home():
+def get_data():
     if CACHE["data"] is None:
         try:
             CACHE["data"] = load_data()
         except Exception as e:
             print(f"Error loading data: {e}")
             CACHE["data"] = {}
+    return CACHE["data"]
 
-    if request.method == "POST":
-        chat_id = session.get("chat_id")
-        if not chat_id:
-            chat_id, _ = get_or_create_chat(new=True)
-            session["chat_id"] = chat_id
+def process_message(chat_id, user_query):
+    """Answer one message and persist the turn. Runs on EXECUTOR."""
+    try:
+        bot_response, image_path = chatbot_response(user_query, get_data())
+        append_chat_messages(chat_id, [
+            {"role": "user", "text": user_query},
+            {"role": "bot", "text": bot_response, "image": image_path},
+        ])
+    except Exception as e:
+        print(f"Error processing message: {e}")
+        bot_response, image_path = "Sorry, I encountered an error.", None
 
-        chat_history = load_chat_history(chat_id)
-        user_query = (request.form.get("user_query") or "").strip()
+    bot_msg = {"role": "bot", "text": bot_response, "image": image_path}
+    return {
+        "bot_html": _BOT_BUBBLE.render(msg=bot_msg),
+        "image": image_path,
+        "title_updated": get_chat_title(chat_id, chat_id in load_pinned_chats()),
+    }
 
-        if user_query:
-            chat_history.append({"role": "user", "text": user_query})
-            try:
-                bot_response = chatbot_response(user_query, CACHE["data"])
-                image_filename = extract_image_filename(bot_response)
-                image_path = None
-
-                if image_filename:
-                    source_path = os.path.join(BASE_DIR, image_filename)
-                    if os.path.exists(source_path):
-                        new_name = f"chart_{uuid.uuid4().hex[:8]}.png"
-                        dest_path = os.path.join(MEDIA_DIR, new_name)
-                        os.rename(source_path, dest_path)
-                        image_path = f"media/{new_name}"
-                
-                chat_history.append({
-                    "role": "bot",
-                    "text": bot_response,
-                    "image": image_path
-                })
-                save_chat_history(chat_id, chat_history)
-            except Exception as e:
-                print(f"Error processing message: {e}")
-                chat_history.append({
-                    "role": "bot",
-                    "text": "Sorry, I encountered an error.",
-                    "image": None
-                })
-    
+def _prune_jobs(now):
+    """Drop finished jobs older than _JOB_TTL. Caller holds _JOBS_LOCK."""
+    jobs = CACHE["jobs"]
+    for job_id, (submitted, future) in list(jobs.items()):
+        if now - submitted < _JOB_TTL:
+            break
+        if future.done():
+            del jobs[job_id]
+
+@app.route("/api/message", methods=["POST"])
+def api_message():
+    chat_id = session.get("chat_id")
+    if not chat_id:
+        chat_id, _ = get_or_create_chat(new=True)
+        session["chat_id"] = chat_id
+
+    user_query = (request.form.get("user_query") or "").strip()
+    if not user_query:
+        return jsonify(error="Empty message"), 400
+
+    job_id = uuid.uuid4().hex
+    future = EXECUTOR.submit(process_message, chat_id, user_query)
+    now = time.monotonic()
+    with _JOBS_LOCK:
+        _prune_jobs(now)
+        CACHE["jobs"][job_id] = (now, future)
+    return jsonify(status="pending", job_id=job_id, user_html=str(escape(user_query))), 202
+
+@app.route("/api/job/<job_id>")
+def api_job(job_id):
+    with _JOBS_LOCK:
+        _prune_jobs(time.monotonic())
+        job = CACHE["jobs"].get(job_id)
+        if job is not None and job[1].done():
+            del CACHE["jobs"][job_id]
+    if job is None:
+        return jsonify(error="Unknown job"), 404
+    future = job[1]
+    if not future.done():
+        return jsonify(status="pending", job_id=job_id)
+    try:
+        result = future.result()
+    except Exception as e:
+        print(f"Error processing message: {e}")
+        return jsonify(status="error", error="Sorry, I encountered an error.")
+    return jsonify(status="done", **result)
+
+@app.route("/")
+def home():
     query_chat_id = request.args.get("chat_id")
     new_chat = request.args.get("new_chat") == "1"
 
@@ -749,14 +1105,14 @@ def home():
         )
     session["chat_id"] = chat_id
 
-    pinned_list = load_pinned_chats()
-    return render_template_string(
-        HTML_TEMPLATE,
+    chat_sessions, pinned_ids, titles = snapshot_sidebar()
+    return _TEMPLATE.render(
         chat_history=chat_history,
-        chat_sessions=list_chat_sessions(),
+        chat_sessions=chat_sessions,
         chat_id=chat_id,
-        get_chat_title=get_chat_title,
-        pinned_chats=pinned_list
+        titles=titles,
+        pinned_chats=pinned_ids,
+        bot_bubble=_BOT_BUBBLE
     )
 
 if __name__ == "__main__":